@@ -2,25 +2,123 @@
 
 import argparse
 import csv
+import heapq
+import math
 import os
 import warnings
+from collections import defaultdict, deque
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
-from decimal import Decimal
+from decimal import ROUND_HALF_EVEN, Decimal
 from enum import Enum
+from fractions import Fraction
+from itertools import accumulate
+from operator import itemgetter
 from pathlib import Path
+from typing import Optional
 
+import numpy
 import pandas
-from dateutil import parser
+from openpyxl import load_workbook
 from pandas import DataFrame
 
+try:
+    from python_calamine import CalamineWorkbook
+except ImportError:
+    CalamineWorkbook = None
+
+SATS_PER_BTC = 100_000_000
+CENTS_PER_USD = 100
+
+BTC_TEMPLATE = "{:.8f} BTC"
+USD_TEMPLATE = "{:.2f}"
+
+
+def to_fixed(amount, scale: int) -> int:
+    """Converts an amount to an integer number of `1 / scale` units.
+
+    Integers and Decimals are scaled directly. Anything else, such as a
+    float, is parsed from its string form so that 1.23 is exactly 1.23.
+    """
+
+    if isinstance(amount, int):
+        return amount * scale
+
+    if not isinstance(amount, Decimal):
+        amount = Decimal(str(amount))
+
+    return int((amount * scale).to_integral_value(ROUND_HALF_EVEN))
+
+
+def to_sats(btc) -> int:
+    """Converts a BTC amount to an integer number of satoshis."""
+    return to_fixed(btc, SATS_PER_BTC)
+
+
+def to_cents(usd) -> int:
+    """Converts a USD amount to an integer number of cents."""
+    return to_fixed(usd, CENTS_PER_USD)
+
+
+def round_divide(numerator: int, denominator: int) -> int:
+    """Returns the integer quotient rounded half to even."""
+
+    quotient, remainder = divmod(numerator, denominator)
+    doubled, denominator = abs(2 * remainder), abs(denominator)
+
+    if doubled > denominator or (doubled == denominator and quotient % 2):
+        quotient += 1
+
+    return quotient
+
+
+def prorate_cents(sats: int, total_sats: int, total_cents: int) -> int:
+    """Returns the cents for the first satoshis of an amount, rounded half to
+    even.
+
+    Pieces of an amount are pro-rated as differences of these running
+    totals, so each piece is within a cent of its exact share and the pieces
+    sum to the amount exactly.
+    """
+
+    if not sats:
+        return 0
+
+    return round_divide(sats * total_cents, total_sats)
+
 
 class Transaction:
-    """A BTCUSD transaction."""
+    """A BTCUSD transaction.
+
+    Amounts are held as integer satoshis and cents so that splitting and
+    matching transactions is exact fixed-point arithmetic.
+    """
+
+    __slots__ = ("_timestamp", "_btc_sats", "_usd_cents")
+
+    IS_SELL = False
 
     def __init__(self, timestamp: datetime, btc: float, usd: float):
         self._timestamp = timestamp
-        self._btc = Decimal(str(btc))
-        self._usd = Decimal(str(usd))
+        self._btc_sats = to_sats(btc)
+        self._usd_cents = to_cents(usd)
+        self.validate()
+
+    @classmethod
+    def from_fixed(cls, timestamp: datetime, btc_sats: int, usd_cents: int):
+        """Returns a new transaction from integer satoshi and cent amounts."""
+
+        transaction = cls.__new__(cls)
+        transaction._timestamp = timestamp
+        transaction._btc_sats = btc_sats
+        transaction._usd_cents = usd_cents
+        transaction.validate()
+
+        return transaction
+
+    def validate(self):
+        """Raises a ValueError if the transaction amounts are invalid."""
 
     @property
     def timestamp(self):
@@ -28,14 +126,24 @@ class Transaction:
         return self._timestamp
 
     @property
-    def btc(self):
+    def btc_sats(self) -> int:
+        """Returns the transactions BTC amount in satoshis."""
+        return self._btc_sats
+
+    @property
+    def usd_cents(self) -> int:
+        """Returns the transactions USD amount in cents."""
+        return self._usd_cents
+
+    @property
+    def btc(self) -> Decimal:
         """Returns the transactions BTC amount."""
-        return self._btc
+        return Decimal(self._btc_sats).scaleb(-8)
 
     @property
-    def usd(self):
+    def usd(self) -> Decimal:
         """Returns the transactions USD amount."""
-        return self._usd
+        return Decimal(self._usd_cents).scaleb(-2)
 
     @property
     def price(self) -> Decimal:
@@ -46,15 +154,24 @@ class Transaction:
         """Splits the transaction at the btc amount and returns two new
         Transaction objects.
         """
-        split_usd = split_btc * self.price
-        remainder_btc = self.btc - split_btc
-        remainder_usd = self.usd - split_usd
+        return self.split_sats(to_sats(split_btc))
 
-        if abs(remainder_usd) <= Decimal("0.0001"):
-            remainder_usd = Decimal("0")
+    def split_sats(
+        self, split_sats: int
+    ) -> tuple["Transaction", "Transaction"]:
+        """Splits the transaction at the satoshi amount and returns two new
+        Transaction objects. The USD amount is pro-rated to the nearest cent.
+        """
+
+        split_usd = round_divide(split_sats * self._usd_cents, self._btc_sats)
+        tx_cls = type(self)
 
-        return type(self)(self.timestamp, split_btc, split_usd), type(self)(
-            self.timestamp, remainder_btc, remainder_usd
+        return tx_cls.from_fixed(
+            self._timestamp, split_sats, split_usd
+        ), tx_cls.from_fixed(
+            self._timestamp,
+            self._btc_sats - split_sats,
+            self._usd_cents - split_usd,
         )
 
     def __eq__(self, other: "Transaction"):
@@ -63,8 +180,8 @@ class Transaction:
 
         return (
             self.timestamp == other.timestamp
-            and self.btc == other.btc
-            and self.usd == other.usd
+            and self.btc_sats == other.btc_sats
+            and self.usd_cents == other.usd_cents
         )
 
     def __repr__(self):
@@ -79,34 +196,40 @@ class Transaction:
 class Buy(Transaction):
     """A BTCUSD buy transaction."""
 
-    def __init__(self, timestamp, btc, usd):
-        if btc < 0:
+    __slots__ = ()
+
+    def validate(self):
+        if self._btc_sats < 0:
             raise ValueError(
-                f"BTC value must be positive for a buy. Got: {timestamp}, {btc}"
+                "BTC value must be positive for a buy. "
+                f"Got: {self.timestamp}, {self.btc}"
             )
-        if usd > 0:
+        if self._usd_cents > 0:
             raise ValueError(
-                f"USD value must be negative for a buy. Got: {timestamp} {usd}"
+                "USD value must be negative for a buy. "
+                f"Got: {self.timestamp} {self.usd}"
             )
 
-        super().__init__(timestamp, btc, usd)
-
 
 class Sell(Transaction):
     """A BTCUSD sell transaction."""
 
-    def __init__(self, timestamp, btc, usd):
-        if btc > 0:
+    __slots__ = ()
+
+    IS_SELL = True
+
+    def validate(self):
+        if self._btc_sats > 0:
             raise ValueError(
-                f"BTC value must be negative for a sell. Got: {timestamp} {btc}"
+                "BTC value must be negative for a sell. "
+                f"Got: {self.timestamp} {self.btc}"
             )
-        if usd < 0:
+        if self._usd_cents < 0:
             raise ValueError(
-                f"USD value must be positive for a sell. Got: {timestamp} {usd}"
+                "USD value must be positive for a sell. "
+                f"Got: {self.timestamp} {self.usd}"
             )
 
-        super().__init__(timestamp, btc, usd)
-
 
 class Duration(Enum):
     """Duration for a capital gain."""
@@ -127,9 +250,12 @@ class Strategy(Enum):
 class CapitalGain:
     """A buy/sell transaction pair for capital gains calculation."""
 
+    __slots__ = ("_buy", "_sell", "_duration")
+
     def __init__(self, buy: Buy, sell: Sell):
         self._buy = buy
         self._sell = sell
+        self._duration = None
 
     @property
     def buy(self):
@@ -141,29 +267,60 @@ class CapitalGain:
 
     @property
     def duration(self):
-        """Returns the duration category of the capital gain."""
+        """Returns the duration category of the capital gain.
 
-        sts = self.sell.timestamp
-        adjusted_sell_timestamp = datetime(
-            sts.year - 1,
+        The gain is long if the buy is more than one calendar year before the
+        sell. This compares the buy timestamp fields, a year later, against
+        the sell timestamp fields, without constructing a new datetime. The
+        result is cached after the first access.
+        """
+
+        if self._duration is not None:
+            return self._duration
+
+        bts, sts = self.buy.timestamp, self.sell.timestamp
+
+        if (bts.tzinfo is None) != (sts.tzinfo is None):
+            raise ValueError(
+                "Buy and sell timestamps must both be naive or both be aware. "
+                f"Got: {bts}, {sts}"
+            )
+
+        if bts.tzinfo != sts.tzinfo:
+            bts = bts.astimezone(sts.tzinfo)
+
+        if (
+            bts.year + 1,
+            bts.month,
+            bts.day,
+            bts.hour,
+            bts.minute,
+            bts.second,
+            bts.microsecond,
+        ) < (
+            sts.year,
             sts.month,
             sts.day,
             sts.hour,
             sts.minute,
             sts.second,
             sts.microsecond,
-            tzinfo=sts.tzinfo,
-        )
+        ):
+            self._duration = Duration.LONG
+        else:
+            self._duration = Duration.SHORT
 
-        if self.buy.timestamp < adjusted_sell_timestamp:
-            return Duration.LONG
+        return self._duration
 
-        return Duration.SHORT
+    @property
+    def gain_cents(self) -> int:
+        """Returns the net profit (or loss) of the capital gain in cents."""
+        return self.sell.usd_cents + self.buy.usd_cents
 
     @property
-    def gain(self):
+    def gain(self) -> Decimal:
         """Returns the net profit (or loss) of the capital gain."""
-        return self.sell.usd + self.buy.usd
+        return Decimal(self.gain_cents).scaleb(-2)
 
     def __eq__(self, other: "CapitalGain"):
         if self is other:
@@ -175,7 +332,164 @@ class CapitalGain:
         return f"CapitalGain({self.buy}, {self.sell})"
 
 
-def transform_gemini_data(path: Path) -> DataFrame:
+class BuyLots:
+    """Open buy lots, ordered for matching by a cost basis strategy.
+
+    Lots are referenced by their index into the transaction amounts. FIFO
+    and LIFO lots are kept in arrival order in a deque and taken from the
+    front or the back. HIFO and LOFO lots are kept in a heap keyed by price,
+    with arrival order breaking ties. The price is computed once per lot,
+    as a float for cheap comparisons and as a Fraction for exact ones when
+    the floats are equal.
+    """
+
+    __slots__ = ("_lots", "_sign", "_top", "_btc_sats", "_usd_cents", "_taken")
+
+    # Price key sign (None for arrival order) and the deque end to take from.
+    ORDERING = {
+        Strategy.FIFO: (None, 0),
+        Strategy.LIFO: (None, -1),
+        Strategy.HIFO: (1, 0),
+        Strategy.LOFO: (-1, 0),
+    }
+
+    def __init__(
+        self, strategy: Strategy, btc_sats: list[int], usd_cents: list[int]
+    ):
+        self._sign, self._top = self.ORDERING[strategy]
+        self._lots = deque() if self._sign is None else []
+        self._btc_sats = btc_sats
+        self._usd_cents = usd_cents
+        self._taken = [0] * len(btc_sats)
+
+    def push(self, index: int):
+        """Adds the buy at the index to the open lots."""
+
+        if self._sign is None:
+            self._lots.append(index)
+            return
+
+        usd, btc = self._sign * self._usd_cents[index], self._btc_sats[index]
+
+        if btc:
+            key = (usd / btc, Fraction(usd, btc))
+        else:
+            # A lot with no BTC has an unbounded price, or none if it is free.
+            key = (math.copysign(math.inf, usd) if usd else 0.0, Fraction(0))
+
+        heapq.heappush(self._lots, (*key, index))
+
+    def peek(self) -> int:
+        """Returns the index of the next lot to be matched."""
+
+        if self._sign is None:
+            return self._lots[self._top]
+
+        return self._lots[0][-1]
+
+    def pop(self) -> int:
+        """Removes and returns the index of the next lot to be matched."""
+
+        if self._sign is not None:
+            return heapq.heappop(self._lots)[-1]
+
+        if self._top:
+            return self._lots.pop()
+
+        return self._lots.popleft()
+
+    def take(self, sats: int) -> tuple[int, int, int]:
+        """Takes up to the satoshi amount from the next lot and returns the
+        lot index with the satoshis and cents taken.
+
+        The lot is removed once it is used up. Cents are pro-rated on the
+        running total taken from the lot.
+        """
+
+        lot = self.peek()
+        lot_sats, lot_cents = self._btc_sats[lot], self._usd_cents[lot]
+        taken = self._taken[lot]
+        start = prorate_cents(taken, lot_sats, lot_cents)
+
+        if sats < lot_sats - taken:
+            self._taken[lot] = taken + sats
+            end = prorate_cents(taken + sats, lot_sats, lot_cents)
+            return lot, sats, end - start
+
+        self.pop()
+
+        return lot, lot_sats - taken, lot_cents - start
+
+    def remaining(self) -> list[tuple[int, int, int]]:
+        """Returns the open lots in chronological order as
+        `(index, sats, cents)` tuples of what is left of each lot.
+        """
+
+        if self._sign is None:
+            indices = list(self._lots)
+        else:
+            indices = sorted(lot[-1] for lot in self._lots)
+
+        return [
+            (
+                index,
+                self._btc_sats[index] - self._taken[index],
+                self._usd_cents[index]
+                - prorate_cents(
+                    self._taken[index],
+                    self._btc_sats[index],
+                    self._usd_cents[index],
+                ),
+            )
+            for index in indices
+        ]
+
+    def __len__(self):
+        return len(self._lots)
+
+
+def iter_xlsx_rows(path: Path, engine: Optional[str] = None):
+    """Yields the rows of the first worksheet of an xlsx file as tuples.
+
+    Rows are read with python-calamine when it is installed and with a
+    read-only openpyxl workbook otherwise. Pass `engine` as "calamine" or
+    "openpyxl" to choose the reader explicitly. Blank cells are None with
+    either reader.
+    """
+
+    if engine is None:
+        engine = "openpyxl" if CalamineWorkbook is None else "calamine"
+
+    if engine == "calamine":
+        if CalamineWorkbook is None:
+            raise ImportError("The calamine engine requires python-calamine.")
+
+        workbook = CalamineWorkbook.from_path(str(path))
+
+        try:
+            for row in workbook.get_sheet_by_index(0).iter_rows():
+                yield tuple(None if value == "" else value for value in row)
+        finally:
+            workbook.close()
+
+        return
+
+    if engine != "openpyxl":
+        raise ValueError(f"Unknown xlsx engine. Got: {engine}")
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        workbook = load_workbook(path, read_only=True, data_only=True)
+
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def transform_gemini_data(
+    path: Path, engine: Optional[str] = None
+) -> DataFrame:
     """Returns a transaction dataframe from a Gemini transaction history."""
 
     columns = {
@@ -186,15 +500,17 @@ def transform_gemini_data(path: Path) -> DataFrame:
     }
     tx_types = ("Buy", "Sell")
 
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        dataframe = pandas.read_excel(path, usecols=columns.keys())
+    rows = iter_xlsx_rows(path, engine)
+    header = next(rows)
+    type_index = header.index("Type")
+    select = itemgetter(*(header.index(column) for column in columns))
+    data = [select(row) for row in rows if row[type_index] in tx_types]
 
-    dataframe = dataframe.rename(columns=columns)
-    dataframe = dataframe.loc[dataframe["type"].isin(tx_types)]
+    dataframe = DataFrame(data, columns=list(columns.values()))
+    dataframe = dataframe.astype({"usd": float, "btc": float})
     dataframe["timestamp"] = pandas.to_datetime(
-        dataframe["timestamp"]
-    ).dt.tz_localize("UTC")
+        dataframe["timestamp"], utc=True, cache=True
+    )
     dataframe = dataframe.sort_values(by=["timestamp"])
 
     return dataframe
@@ -213,8 +529,10 @@ def transform_swan_data(path: Path) -> DataFrame:
     dataframe = pandas.read_csv(path, usecols=columns.keys(), skiprows=2)
     dataframe = dataframe.rename(columns=columns)
     dataframe = dataframe.loc[dataframe["type"] == "purchase"]
-    dataframe["timestamp"] = pandas.to_datetime(dataframe["timestamp"])
-    dataframe["type"] = dataframe["type"].str.replace("purchase", "Buy")
+    dataframe["timestamp"] = pandas.to_datetime(
+        dataframe["timestamp"], utc=True, cache=True
+    )
+    dataframe["type"] = "Buy"
     dataframe["usd"] *= -1
     dataframe = dataframe.sort_values(by=["timestamp"])
 
@@ -230,6 +548,16 @@ def transform_cashapp_data(path: Path) -> DataFrame:
         "Amount": "usd",
         "Asset Amount": "btc",
     }
+    tz_offsets = {
+        "EST": "-0500",
+        "EDT": "-0400",
+        "CST": "-0600",
+        "CDT": "-0500",
+        "MST": "-0700",
+        "MDT": "-0600",
+        "PST": "-0800",
+        "PDT": "-0700",
+    }
 
     dataframe = pandas.read_csv(path, usecols=columns.keys())
     dataframe = dataframe.rename(columns=columns)
@@ -237,16 +565,25 @@ def transform_cashapp_data(path: Path) -> DataFrame:
     dataframe = dataframe.loc[
         dataframe["type"].isin(("Bitcoin Buy", "Bitcoin Sale"))
     ]
-    dataframe["timestamp"] = [
-        parser.parse(ts) if pandas.notna(ts) else pandas.NaT
-        for ts in dataframe["timestamp"]
-    ]
-    dataframe["timestamp"] = dataframe["timestamp"].dt.tz_convert("UTC")
-    dataframe["type"] = dataframe["type"].str.replace("Bitcoin Buy", "Buy")
-    dataframe["type"] = dataframe["type"].str.replace("Bitcoin Sale", "Sell")
+    timestamps = dataframe["timestamp"].str.rsplit(" ", n=1, expand=True)
+    unknown_tz = set(timestamps[1].dropna()) - tz_offsets.keys()
+
+    if unknown_tz:
+        raise ValueError(f"Unknown Cash App timezone. Got: {unknown_tz}")
 
+    dataframe["timestamp"] = pandas.to_datetime(
+        timestamps[0] + " " + timestamps[1].map(tz_offsets),
+        format="%Y-%m-%d %H:%M:%S %z",
+        utc=True,
+        cache=True,
+    )
+    dataframe["type"] = (
+        dataframe["type"]
+        .astype("category")
+        .cat.rename_categories({"Bitcoin Buy": "Buy", "Bitcoin Sale": "Sell"})
+    )
     dataframe["usd"] = (
-        dataframe["usd"].str.replace("$", "").str.replace(",", "").astype(float)
+        dataframe["usd"].str.replace(r"[$,]", "", regex=True).astype(float)
     )
     dataframe.loc[dataframe["type"] == "Sell", "btc"] *= -1
     dataframe = dataframe.sort_values(by=["timestamp"])
@@ -268,22 +605,45 @@ def transform_generic_data(path: Path):
 
 def get_transactions(input_df: DataFrame):
     """Returns a list of transactions from the input dataframe"""
-    tx_cls = {"Buy": Buy, "Sell": Sell}
+
+    from_fixed = {"Buy": Buy.from_fixed, "Sell": Sell.from_fixed}
+    timestamps = input_df["timestamp"].tolist()
+    btc = input_df["btc"].to_numpy(dtype=float)
+    usd = input_df["usd"].to_numpy(dtype=float)
+
+    missing = ~(numpy.isfinite(btc) & numpy.isfinite(usd))
+
+    if missing.any():
+        index = int(missing.argmax())
+        raise ValueError(
+            "BTC and USD values must be finite numbers. "
+            f"Got: {timestamps[index]} {btc[index]} {usd[index]}"
+        )
+
+    btc_sats = numpy.rint(btc * SATS_PER_BTC).astype(numpy.int64)
+    usd_cents = numpy.rint(usd * CENTS_PER_USD).astype(numpy.int64)
+
     return [
-        tx_cls[r.type](r.timestamp, r.btc, r.usd) for r in input_df.itertuples()
+        from_fixed[tx_type](timestamp, sats, cents)
+        for timestamp, tx_type, sats, cents in zip(
+            timestamps,
+            input_df["type"].tolist(),
+            btc_sats.tolist(),
+            usd_cents.tolist(),
+        )
     ]
 
 
 def has_sell(transactions: list[Transaction]):
     """Returns True if there is a Sell in the transaction list."""
-    return any(isinstance(t, Sell) for t in transactions)
+    return any(t.IS_SELL for t in transactions)
 
 
 def next_sell_index(transactions: list[Transaction]):
     """Returns the index of the first Sell in the transaction list."""
 
     for index, transaction in enumerate(transactions):
-        if isinstance(transaction, Sell):
+        if transaction.IS_SELL:
             return index
 
     return None
@@ -294,67 +654,169 @@ def extract_sell(
 ):
     """Extracts the sell transaction and its matching buy transactions
     according to the given strategy.
+
+    The transactions before the sell must be buys. They are matched with
+    `match_lots`, the sell and the used up buys are removed, and what is
+    left of a partially used buy stays in its place.
     """
 
     assert isinstance(
         transactions[sell_index], Sell
     ), "Transaction at `sell_index` must be a Sell."
+    assert not has_sell(
+        transactions[:sell_index]
+    ), "Transactions before `sell_index` must be buys."
+
+    sell = transactions[sell_index]
+    window = transactions[: sell_index + 1]
+    matches, remaining = match_lots(
+        [t.btc_sats for t in window],
+        [t.usd_cents for t in window],
+        [t.IS_SELL for t in window],
+        strategy,
+    )
 
-    sell = transactions.pop(sell_index)
-    buys = []
+    buys = [
+        Buy.from_fixed(window[buy].timestamp, sats, cents)
+        for buy, _, sats, cents, _ in matches
+    ]
+    transactions[: sell_index + 1] = [
+        Buy.from_fixed(window[buy].timestamp, sats, cents)
+        for buy, sats, cents in remaining
+    ]
 
-    if strategy == Strategy.LIFO:
-        buy_index = sell_index - 1
-        btc = -sell.btc
+    return sell, buys
 
-        while btc:
-            pbuy = transactions.pop(buy_index)
 
-            if btc < pbuy.btc:
-                split, remainder = pbuy.split(btc)
-                buys.append(split)
-                transactions.insert(buy_index, remainder)
-                btc -= split.btc
-            else:
-                buys.append(pbuy)
-                buy_index -= 1
-                btc -= pbuy.btc
+def split_sell(sell: Sell, buys: list[Buy]):
+    """Splits a sell transaction according to its matched buys.
 
-    return sell, buys
+    The USD amount is pro-rated on the running BTC total so that each split
+    is rounded to the nearest cent and the splits sum to the sell exactly.
+    """
 
+    split_sats = [-buy.btc_sats for buy in buys]
 
-def split_sell(sell: Sell, buys: list[Buy]):
-    """Splits a sell transaction according to its matched buys."""
+    assert sell.btc_sats == sum(split_sats), "BTC amount must match."
 
-    assert sell.btc == -sum(b.btc for b in buys), "BTC amount must match."
+    usd_cents = [
+        prorate_cents(sats, sell.btc_sats, sell.usd_cents)
+        for sats in accumulate(split_sats, initial=0)
+    ]
 
-    sells = []
+    return [
+        Sell.from_fixed(sell.timestamp, sats, end - start)
+        for sats, start, end in zip(split_sats, usd_cents, usd_cents[1:])
+    ]
 
-    for buy in buys:
-        split, sell = sell.split(-buy.btc)
-        sells.append(split)
 
-    return sells
+def match_lots(
+    btc_sats: list[int],
+    usd_cents: list[int],
+    sells: list[bool],
+    strategy: Strategy,
+):
+    """Matches sells to open buy lots using integer amounts only.
+
+    Takes the satoshi and cent amounts of chronologically ordered
+    transactions and whether each one is a sell. Returns the matches as
+    `(buy_index, sell_index, sats, buy_cents, sell_cents)` tuples and the
+    unmatched lots as `(buy_index, sats, cents)` tuples. The cents of the
+    pieces of a sell or a lot are pro-rated on running totals, as in
+    `split_sell`.
+    """
 
+    lots = BuyLots(strategy, btc_sats, usd_cents)
+    matches = []
 
-def match_capital_gains(transactions: list[Transaction]):
-    """Matches up sell transactions to buy transactions for capital gains."""
+    for index, is_sell in enumerate(sells):
+        if not is_sell:
+            lots.push(index)
+            continue
 
-    sell_vol = sum(s.btc for s in transactions if isinstance(s, Sell))
-    buy_vol = sum(b.btc for b in transactions if isinstance(b, Buy))
+        sats, cents, matched = -btc_sats[index], usd_cents[index], 0
 
-    assert sell_vol < buy_vol, "Cannot sell more BTC than what was bought."
+        while matched < sats:
+            assert lots, "Cannot sell more BTC than what was bought."
+            lot, lot_sats, buy_cents = lots.take(sats - matched)
+            sell_cents = prorate_cents(
+                matched + lot_sats, sats, cents
+            ) - prorate_cents(matched, sats, cents)
+            matched += lot_sats
 
-    cap_gains = []
+            matches.append((lot, index, lot_sats, buy_cents, sell_cents))
 
-    while has_sell(transactions):
-        sell_index = next_sell_index(transactions)
-        sell, buys = extract_sell(transactions, sell_index, Strategy.LIFO)
-        cap_gains += [
-            CapitalGain(b, s) for b, s in zip(buys, split_sell(sell, buys))
-        ]
+    return matches, lots.remaining()
 
-    return cap_gains
+
+def iter_capital_gains(
+    transactions: list[Transaction], strategy: Strategy = Strategy.LIFO
+) -> Iterator[CapitalGain]:
+    """Matches up sell transactions to buy transactions and returns an
+    iterator over the capital gains.
+
+    Matching is done before this returns, leaving the transaction list
+    holding the unmatched buys. Capital gains are then built one at a time
+    as the iterator is consumed.
+    """
+
+    matches, remaining = match_lots(
+        [t.btc_sats for t in transactions],
+        [t.usd_cents for t in transactions],
+        [t.IS_SELL for t in transactions],
+        strategy,
+    )
+
+    timestamps = [t.timestamp for t in transactions]
+
+    transactions[:] = [
+        Buy.from_fixed(timestamps[buy], sats, cents)
+        for buy, sats, cents in remaining
+    ]
+
+    return (
+        CapitalGain(
+            Buy.from_fixed(timestamps[buy], sats, buy_cents),
+            Sell.from_fixed(timestamps[sell], -sats, sell_cents),
+        )
+        for buy, sell, sats, buy_cents, sell_cents in matches
+    )
+
+
+def match_capital_gains(
+    transactions: list[Transaction], strategy: Strategy = Strategy.LIFO
+):
+    """Matches up sell transactions to buy transactions for capital gains.
+
+    Transactions are matched in a single pass in chronological order. Buys
+    are held as open lots and each sell consumes lots in the order given by
+    the strategy. The transaction list is left holding the unmatched buys.
+    Selling more BTC than is held at the time of a sell fails an assertion
+    during matching.
+    """
+
+    return list(iter_capital_gains(transactions, strategy))
+
+
+def format_date(timestamp: datetime) -> str:
+    """Returns the date formatted as MM/DD/YYYY."""
+
+    return f"{timestamp.month:02d}/{timestamp.day:02d}/{timestamp.year}"
+
+
+def format_row(gain: CapitalGain) -> tuple[str, ...]:
+    """Returns the report table row for a capital gain."""
+
+    buy, sell = gain.buy, gain.sell
+
+    return (
+        BTC_TEMPLATE.format(buy.btc_sats / SATS_PER_BTC),
+        format_date(buy.timestamp),
+        format_date(sell.timestamp),
+        USD_TEMPLATE.format(sell.usd_cents / CENTS_PER_USD),
+        USD_TEMPLATE.format(abs(buy.usd_cents) / CENTS_PER_USD),
+        USD_TEMPLATE.format((sell.usd_cents + buy.usd_cents) / CENTS_PER_USD),
+    )
 
 
 def tabulate(cap_gains: list[CapitalGain]):
@@ -362,30 +824,38 @@ def tabulate(cap_gains: list[CapitalGain]):
     formats capital gain information into table rows for reporting.
     """
 
-    table = {
-        Duration.SHORT: {},
-        Duration.LONG: {},
-    }
+    short, long = defaultdict(list), defaultdict(list)
+    table = {Duration.SHORT: short, Duration.LONG: long}
 
     for gain in cap_gains:
-        duration = gain.duration
-        year = gain.sell.timestamp.year
+        table[gain.duration][gain.sell.timestamp.year].append(format_row(gain))
 
-        description = f"{gain.buy.btc:.8f} BTC"
-        date_acquired = gain.buy.timestamp.strftime("%m/%d/%Y")
-        date_sold = gain.sell.timestamp.strftime("%m/%d/%Y")
-        proceeds = f"{gain.sell.usd:.2f}"
-        cost_basis = f"{abs(gain.buy.usd):.2f}"
-        gains = f"{gain.gain:.2f}"
+    return dict(short), dict(long)
 
-        if not table[duration].get(year):
-            table[duration].update({year: []})
 
-        table[duration][year].append(
-            (description, date_acquired, date_sold, proceeds, cost_basis, gains)
-        )
+GAINS_HEADER = (
+    "Description of Property",
+    "Date Acquired",
+    "Date Sold or Disposed Of",
+    "Proceeds (Sales Price)",
+    "Cost or Other Basis",
+    "Gain or (loss)",
+)
 
-    return table[Duration.SHORT], table[Duration.LONG]
+
+@contextmanager
+def open_gains_file(output: Path, year: int, duration: Duration):
+    """Opens the csv file for a year's capital gains of the given duration
+    and yields it with the header already written.
+    """
+
+    file_path = output / f"{year}_{duration.value.lower()}_gains.csv"
+
+    with open(
+        file_path, "w", encoding="utf-8", newline="", buffering=1 << 20
+    ) as file:
+        csv.writer(file).writerow(GAINS_HEADER)
+        yield file
 
 
 def write_capital_gains(
@@ -393,32 +863,36 @@ def write_capital_gains(
 ):
     """Writes the capital gains to csv files in the output directory."""
 
-    header = [
-        "Description of Property",
-        "Date Acquired",
-        "Date Sold or Disposed Of",
-        "Proceeds (Sales Price)",
-        "Cost or Other Basis",
-        "Gain or (loss)",
-    ]
+    output.mkdir(exist_ok=True)
+
+    for duration, table in ((Duration.SHORT, short), (Duration.LONG, long)):
+        for year, rows in table.items():
+            with open_gains_file(output, year, duration) as file:
+                csv.writer(file).writerows(rows)
+
+
+def write_gains_streaming(output: Path, cap_gains: Iterable[CapitalGain]):
+    """Writes capital gains to csv files in the output directory as they are
+    produced.
+
+    Each file is opened on the first capital gain for its year and duration
+    and all files are closed once the capital gains are exhausted.
+    """
 
     output.mkdir(exist_ok=True)
 
-    for year, rows in short.items():
-        file_path = output / f"{year}_short_gains.csv"
-        with open(file_path, "w", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            writer.writerow(header)
-            for row in rows:
-                writer.writerow(row)
+    with ExitStack() as stack:
+        writers = {}
+
+        for gain in cap_gains:
+            key = (gain.sell.timestamp.year, gain.duration)
+            writer = writers.get(key)
 
-    for year, rows in long.items():
-        file_path = output / f"{year}_long_gains.csv"
-        with open(file_path, "w", encoding="utf-8") as file:
-            writer = csv.writer(file)
-            writer.writerow(header)
-            for row in rows:
-                writer.writerow(row)
+            if writer is None:
+                file = stack.enter_context(open_gains_file(output, *key))
+                writer = writers[key] = csv.writer(file)
+
+            writer.writerow(format_row(gain))
 
 
 def main(args):
@@ -436,21 +910,21 @@ def main(args):
     input_path = Path(args.input)
     output_path = Path(args.output)
 
-    transactions_ = []
-
-    for file in os.listdir(input_path):
-        file_path = input_path / file
-
-        if file in transformer:
-            data = transformer[file](file_path)
-            transactions_ += get_transactions(data)
-
-    transactions_.sort(key=lambda tx: tx.timestamp)
+    with pandas.option_context("mode.copy_on_write", True):
+        frames = [
+            transformer[file](input_path / file)
+            for file in os.listdir(input_path)
+            if file in transformer
+        ]
 
-    cap_gains_ = match_capital_gains(transactions_)
-    short, long = tabulate(cap_gains_)
+        if frames:
+            input_df = pandas.concat(frames, ignore_index=True)
+            input_df.sort_values("timestamp", kind="stable", inplace=True)
+            transactions_ = get_transactions(input_df)
+        else:
+            transactions_ = []
 
-    write_capital_gains(output_path, short, long)
+    write_gains_streaming(output_path, iter_capital_gains(transactions_))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,12 @@
+"""Shared test configuration."""
+
+import pandas
+import pytest
+
+
+@pytest.fixture(scope="session", autouse=True)
+def copy_on_write_fixture():
+    """Runs the tests with pandas copy-on-write enabled, as the program does."""
+
+    with pandas.option_context("mode.copy_on_write", True):
+        yield
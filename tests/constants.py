@@ -0,0 +1,11 @@
+"""Constants shared by the tests."""
+
+from pathlib import Path
+
+TEST_INPUTS_PATH = Path("tests/input/")
+
+CASHAPP_HEADER = (
+    "Transaction ID,Date,Transaction Type,Currency,Amount,Fee,Net Amount,"
+    "Asset Type,Asset Price,Asset Amount,Status,Notes,"
+    "Name of sender/receiver,Account\n"
+)
@@ -1,6 +1,8 @@
 """Tests for bitcoin capital gains calculator."""
 
-from datetime import datetime
+from datetime import datetime, timezone
+
+import pytest
 
 from btax import (
     Buy,
@@ -10,7 +12,9 @@ from btax import (
     Strategy,
     extract_sell,
     has_sell,
+    iter_capital_gains,
     match_capital_gains,
+    match_lots,
     next_sell_index,
     split_sell,
 )
@@ -68,6 +72,24 @@ def test_extract_sell():
     ]
 
 
+def test_extract_sell_fifo():
+    """Should extract the sell and its matching buys in strategy order."""
+
+    transactions = [
+        Buy(datetime(2020, 1, 1), 1, -1),
+        Buy(datetime(2020, 1, 2), 1, -1),
+        Sell(datetime(2020, 1, 3), -1.5, 15),
+    ]
+    sell, buys = extract_sell(transactions, 2, Strategy.FIFO)
+
+    assert sell == Sell(datetime(2020, 1, 3), -1.5, 15)
+    assert buys == [
+        Buy(datetime(2020, 1, 1), 1, -1),
+        Buy(datetime(2020, 1, 2), 0.5, -0.5),
+    ]
+    assert transactions == [Buy(datetime(2020, 1, 2), 0.5, -0.5)]
+
+
 def test_split_sell():
     """Should split a sell transaction according to its matched buys."""
 
@@ -87,6 +109,18 @@ def test_split_sell():
     ]
 
 
+def test_split_sell_rounding():
+    """Should pro-rate a sell to the cent with splits summing to the sell."""
+
+    sell = Sell.from_fixed(datetime(2021, 1, 1), -3, 100)
+    buys = [Buy.from_fixed(datetime(2020, 1, day), 1, -1) for day in (1, 2, 3)]
+
+    sells = split_sell(sell, buys)
+
+    assert [s.usd_cents for s in sells] == [33, 34, 33]
+    assert sum(s.usd_cents for s in sells) == sell.usd_cents
+
+
 def test_match_capital_gains():
     """Should match up buys to sells as cap gain pairs."""
 
@@ -125,6 +159,179 @@ def test_match_capital_gains():
     ]
 
 
+def test_match_lots():
+    """Should match sells to buy lots using integer amounts."""
+
+    matches, remaining = match_lots(
+        [100, 200, -250, 100],
+        [-1000, -3000, 5000, -2000],
+        [False, False, True, False],
+        Strategy.FIFO,
+    )
+
+    assert matches == [(0, 2, 100, -1000, 2000), (1, 2, 150, -2250, 3000)]
+    assert remaining == [(1, 50, -750), (3, 100, -2000)]
+
+
+def test_match_lots_price_tie():
+    """Should match equally priced lots in arrival order."""
+
+    matches, _ = match_lots(
+        [100, 200, -100],
+        [-1000, -2000, 5000],
+        [False, False, True],
+        Strategy.HIFO,
+    )
+
+    assert matches == [(0, 2, 100, -1000, 5000)]
+
+
+def test_match_lots_rounding():
+    """Should pro-rate sell and partial lot cents on running totals."""
+
+    matches, _ = match_lots(
+        [4, 1, 3, 1, -9],
+        [-40, -10, -30, -10, 185],
+        [False] * 4 + [True],
+        Strategy.FIFO,
+    )
+
+    assert [match[-1] for match in matches] == [82, 21, 61, 21]
+
+    matches, _ = match_lots(
+        [9, -4, -1, -3, -1],
+        [-185, 40, 10, 30, 10],
+        [False] + [True] * 4,
+        Strategy.FIFO,
+    )
+
+    assert [match[-2] for match in matches] == [-82, -21, -61, -21]
+
+
+def test_match_lots_zero_btc():
+    """Should order a buy with no BTC as the highest price lot."""
+
+    amounts = ([100, 0, 100, -100], [-1000, -500, -3000, 4000])
+    sells = [False, False, False, True]
+
+    matches, remaining = match_lots(*amounts, sells, Strategy.HIFO)
+
+    assert matches == [(1, 3, 0, -500, 0), (2, 3, 100, -3000, 4000)]
+    assert remaining == [(0, 100, -1000)]
+
+    matches, remaining = match_lots(*amounts, sells, Strategy.LOFO)
+
+    assert matches == [(0, 3, 100, -1000, 4000)]
+    assert remaining == [(1, 0, -500), (2, 100, -3000)]
+
+
+@pytest.fixture(name="lot_transactions")
+def lot_transactions_fixture():
+    """Returns buys at different prices followed by a partial sell."""
+
+    return [
+        Buy(datetime(2020, 1, 1), 1, -10),
+        Buy(datetime(2020, 2, 1), 1, -30),
+        Buy(datetime(2020, 3, 1), 1, -20),
+        Sell(datetime(2020, 4, 1), -1.5, 60),
+    ]
+
+
+def test_iter_capital_gains(lot_transactions):
+    """Should match eagerly and build the capital gains lazily."""
+
+    cap_gains = iter_capital_gains(lot_transactions, Strategy.FIFO)
+
+    assert lot_transactions == [
+        Buy(datetime(2020, 2, 1), 0.5, -15),
+        Buy(datetime(2020, 3, 1), 1, -20),
+    ]
+    assert next(cap_gains) == CapitalGain(
+        Buy(datetime(2020, 1, 1), 1, -10),
+        Sell(datetime(2020, 4, 1), -1, 40),
+    )
+    assert len(list(cap_gains)) == 1
+
+
+def test_match_capital_gains_oversell():
+    """Should fail when a sell exceeds the BTC held at the time."""
+
+    transactions = [
+        Buy(datetime(2020, 1, 1), 1, -1),
+        Sell(datetime(2020, 2, 1), -2, 20),
+        Buy(datetime(2020, 3, 1), 5, -5),
+    ]
+
+    with pytest.raises(AssertionError, match="Cannot sell more BTC"):
+        match_capital_gains(transactions)
+
+
+def test_match_capital_gains_fifo(lot_transactions):
+    """Should match the earliest buys first."""
+
+    cap_gains = match_capital_gains(lot_transactions, Strategy.FIFO)
+
+    assert cap_gains == [
+        CapitalGain(
+            Buy(datetime(2020, 1, 1), 1, -10),
+            Sell(datetime(2020, 4, 1), -1, 40),
+        ),
+        CapitalGain(
+            Buy(datetime(2020, 2, 1), 0.5, -15),
+            Sell(datetime(2020, 4, 1), -0.5, 20),
+        ),
+    ]
+
+    assert lot_transactions == [
+        Buy(datetime(2020, 2, 1), 0.5, -15),
+        Buy(datetime(2020, 3, 1), 1, -20),
+    ]
+
+
+def test_match_capital_gains_hifo(lot_transactions):
+    """Should match the most expensive buys first."""
+
+    cap_gains = match_capital_gains(lot_transactions, Strategy.HIFO)
+
+    assert cap_gains == [
+        CapitalGain(
+            Buy(datetime(2020, 2, 1), 1, -30),
+            Sell(datetime(2020, 4, 1), -1, 40),
+        ),
+        CapitalGain(
+            Buy(datetime(2020, 3, 1), 0.5, -10),
+            Sell(datetime(2020, 4, 1), -0.5, 20),
+        ),
+    ]
+
+    assert lot_transactions == [
+        Buy(datetime(2020, 1, 1), 1, -10),
+        Buy(datetime(2020, 3, 1), 0.5, -10),
+    ]
+
+
+def test_match_capital_gains_lofo(lot_transactions):
+    """Should match the least expensive buys first."""
+
+    cap_gains = match_capital_gains(lot_transactions, Strategy.LOFO)
+
+    assert cap_gains == [
+        CapitalGain(
+            Buy(datetime(2020, 1, 1), 1, -10),
+            Sell(datetime(2020, 4, 1), -1, 40),
+        ),
+        CapitalGain(
+            Buy(datetime(2020, 3, 1), 0.5, -10),
+            Sell(datetime(2020, 4, 1), -0.5, 20),
+        ),
+    ]
+
+    assert lot_transactions == [
+        Buy(datetime(2020, 2, 1), 1, -30),
+        Buy(datetime(2020, 3, 1), 0.5, -10),
+    ]
+
+
 def test_capital_gain_long_duration():
     """Should detect if a capital gain is long"""
 
@@ -154,6 +361,20 @@ def test_capital_gain_short_duration_exact_year():
     assert cap_gain.duration == Duration.SHORT
 
 
+def test_capital_gain_leap_day_duration():
+    """Should classify a sell on a leap day against the previous year."""
+
+    long_gain = CapitalGain(
+        Buy(datetime(2023, 2, 28), 1, -1), Sell(datetime(2024, 2, 29), -1, 10)
+    )
+    short_gain = CapitalGain(
+        Buy(datetime(2023, 3, 1), 1, -1), Sell(datetime(2024, 2, 29), -1, 10)
+    )
+
+    assert long_gain.duration == Duration.LONG
+    assert short_gain.duration == Duration.SHORT
+
+
 def test_capital_gain_gain():
     """Should calculate the gain of the capital gain."""
 
@@ -162,3 +383,15 @@ def test_capital_gain_gain():
     )
 
     assert cap_gain.gain == 9
+
+
+def test_capital_gain_mixed_timezone_duration():
+    """Should refuse to compare a naive timestamp with an aware one."""
+
+    cap_gain = CapitalGain(
+        Buy(datetime(2020, 1, 1), 1, -1),
+        Sell(datetime(2021, 6, 1, tzinfo=timezone.utc), -1, 10),
+    )
+
+    with pytest.raises(ValueError, match="both be naive or both be aware"):
+        _ = cap_gain.duration
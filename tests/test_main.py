@@ -0,0 +1,85 @@
+"""End to end program tests."""
+
+import csv
+import shutil
+from argparse import Namespace
+from pathlib import Path
+
+import pandas
+
+from btax import main
+
+from .constants import CASHAPP_HEADER, TEST_INPUTS_PATH
+
+CASHAPP_ROWS = CASHAPP_HEADER + (
+    'a,2024-06-01 10:00:00 EDT,Bitcoin Sale,USD,"$2,100",$0,"$2,100",BTC,'
+    '"$70,000",0.03,COMPLETED,,,Your Cash\n'
+    'b,2023-12-01 10:00:00 EST,Bitcoin Sale,USD,"$2,000",$0,"$2,000",BTC,'
+    '"$50,000",0.04,COMPLETED,,,Your Cash\n'
+    'c,2022-01-03 10:00:00 EST,Bitcoin Buy,USD,"-$2,000",$0,"-$2,000",BTC,'
+    '"$40,000",0.05,COMPLETED,,,Your Cash\n'
+)
+
+
+def read_rows(path: Path) -> list[list[str]]:
+    """Returns the rows of a csv file without its header."""
+
+    with open(path, "r", encoding="utf-8") as file:
+        return list(csv.reader(file))[1:]
+
+
+def test_main(tmp_path):
+    """Should match transactions from every source and write the reports."""
+
+    input_path, output_path = tmp_path / "input", tmp_path / "output"
+    input_path.mkdir()
+    shutil.copy2(TEST_INPUTS_PATH / "swan.csv", input_path / "swan.xlsx")
+    (input_path / "cashapp.xlsx").write_text(CASHAPP_ROWS, encoding="utf-8")
+
+    with pandas.option_context("mode.copy_on_write", False):
+        main(Namespace(input=input_path, output=output_path))
+        assert pandas.get_option("mode.copy_on_write") is False
+
+    assert sorted(file.name for file in output_path.iterdir()) == [
+        "2023_short_gains.csv",
+        "2024_long_gains.csv",
+        "2024_short_gains.csv",
+    ]
+    assert read_rows(output_path / "2023_short_gains.csv") == [
+        [
+            "0.01362289 BTC",
+            "11/14/2023",
+            "12/01/2023",
+            "681.14",
+            "500.00",
+            "181.14",
+        ],
+        [
+            "0.02637711 BTC",
+            "06/13/2023",
+            "12/01/2023",
+            "1318.86",
+            "682.23",
+            "636.63",
+        ],
+    ]
+    assert read_rows(output_path / "2024_short_gains.csv") == [
+        [
+            "0.00841979 BTC",
+            "06/13/2023",
+            "06/01/2024",
+            "589.39",
+            "217.77",
+            "371.62",
+        ],
+    ]
+    assert read_rows(output_path / "2024_long_gains.csv") == [
+        [
+            "0.02158021 BTC",
+            "01/03/2022",
+            "06/01/2024",
+            "1510.61",
+            "863.21",
+            "647.40",
+        ],
+    ]
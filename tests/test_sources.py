@@ -1,12 +1,14 @@
 """Source transformation tests."""
 
-import shutil
 from datetime import datetime, timezone
 from pathlib import Path
 
 import pytest
+from openpyxl import Workbook
 from pandas import DataFrame
+from pandas.testing import assert_frame_equal
 
+import btax
 from btax import (
     Buy,
     Sell,
@@ -16,40 +18,31 @@ from btax import (
     transform_swan_data,
 )
 
-TEST_INPUTS_PATH = Path("tests/input/")
+from .constants import CASHAPP_HEADER, TEST_INPUTS_PATH
 
 
 @pytest.fixture(scope="function", name="gemini_input")
-def gemini_input_fixture(tmp_path: Path) -> Path:
+def gemini_input_fixture() -> Path:
     """Provides a minimal gemini transaction history file path."""
 
-    filename = "gemini.xlsx"
-    shutil.copy2(TEST_INPUTS_PATH / filename, tmp_path)
-
-    return tmp_path / filename
+    return TEST_INPUTS_PATH / "gemini.xlsx"
 
 
 @pytest.fixture(scope="function", name="swan_input")
-def swan_input_fixture(tmp_path: Path) -> Path:
+def swan_input_fixture() -> Path:
     """Provides a minimal swan transaction history file path."""
 
-    filename = "swan.csv"
-    shutil.copy2(TEST_INPUTS_PATH / filename, tmp_path)
-
-    return tmp_path / filename
+    return TEST_INPUTS_PATH / "swan.csv"
 
 
 @pytest.fixture(scope="function", name="cashapp_input")
-def cashapp_input_fixture(tmp_path: Path) -> Path:
+def cashapp_input_fixture() -> Path:
     """Provides a minimal cashapp transaction history file path."""
 
-    filename = "cashapp.csv"
-    shutil.copy2(TEST_INPUTS_PATH / filename, tmp_path)
+    return TEST_INPUTS_PATH / "cashapp.csv"
 
-    return tmp_path / filename
 
-
-@pytest.fixture(name="gemini_input_df")
+@pytest.fixture(scope="session", name="gemini_input_df")
 def gemini_input_dataframe_fixture():
     """Returns a sample transaction input dataframe."""
 
@@ -69,7 +62,7 @@ def gemini_input_dataframe_fixture():
     )
 
 
-@pytest.fixture(name="swan_input_df")
+@pytest.fixture(scope="session", name="swan_input_df")
 def swan_input_dataframe_fixture():
     """Returns a sample transaction input dataframe."""
 
@@ -86,7 +79,7 @@ def swan_input_dataframe_fixture():
     )
 
 
-@pytest.fixture(name="cashapp_input_df")
+@pytest.fixture(scope="session", name="cashapp_input_df")
 def cashapp_input_dataframe_fixture():
     """Returns a sample transaction input dataframe."""
 
@@ -105,7 +98,7 @@ def cashapp_input_dataframe_fixture():
     )
 
 
-@pytest.fixture(name="gemini_transactions")
+@pytest.fixture(scope="session", name="gemini_transactions")
 def gemini_txs_fixture():
     """Returns the transactions from the gemini input."""
 
@@ -130,16 +123,81 @@ def gemini_txs_fixture():
     ]
 
 
-def test_transform_gemini_data(gemini_input, gemini_input_df):
+@pytest.mark.parametrize("engine", ["calamine", "openpyxl"])
+def test_transform_gemini_data(gemini_input, gemini_input_df, engine):
     """Should read Gemini transaction history into buys and sells."""
 
-    dataframe = transform_gemini_data(gemini_input)
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+
+    dataframe = transform_gemini_data(gemini_input, engine)
     expected = gemini_input_df
 
-    assert dataframe["timestamp"].tolist() == expected["timestamp"].tolist()
-    assert dataframe["type"].tolist() == expected["type"].tolist()
-    assert dataframe["usd"].tolist() == expected["usd"].tolist()
-    assert dataframe["btc"].tolist() == expected["btc"].tolist()
+    assert_frame_equal(
+        dataframe.reset_index(drop=True),
+        expected,
+        check_dtype=False,
+        check_categorical=False,
+        check_like=True,
+    )
+
+
+GEMINI_HEADER = ("Date", "Type", "USD Amount USD", "BTC Amount BTC")
+
+
+@pytest.mark.parametrize("engine", ["calamine", "openpyxl"])
+def test_transform_gemini_data_first_sheet(tmp_path, engine):
+    """Should read the first worksheet even when another one is active."""
+
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+
+    workbook = Workbook()
+    first = workbook.active
+    second = workbook.create_sheet()
+
+    for sheet, usd in ((first, -5), (second, -7)):
+        sheet.append(GEMINI_HEADER)
+        sheet.append((datetime(2020, 1, 1), "Buy", usd, 1))
+
+    workbook.active = 1
+    path = tmp_path / "gemini.xlsx"
+    workbook.save(path)
+
+    dataframe = transform_gemini_data(path, engine)
+
+    assert dataframe["usd"].tolist() == [-5]
+
+
+@pytest.mark.parametrize("engine", ["calamine", "openpyxl"])
+def test_transform_gemini_data_blank_amount(tmp_path, engine):
+    """Should read a blank amount cell as missing with either engine."""
+
+    if engine == "calamine":
+        pytest.importorskip("python_calamine")
+
+    workbook = Workbook()
+    workbook.active.append(GEMINI_HEADER)
+    workbook.active.append((datetime(2020, 1, 1), "Buy", -5, 1))
+    workbook.active.append((datetime(2020, 1, 2), "Buy", None, 1))
+    path = tmp_path / "gemini.xlsx"
+    workbook.save(path)
+
+    dataframe = transform_gemini_data(path, engine)
+
+    assert dataframe["usd"].dtype == float
+
+    with pytest.raises(ValueError, match="must be finite numbers"):
+        get_transactions(dataframe)
+
+
+def test_transform_gemini_data_missing_engine(gemini_input, monkeypatch):
+    """Should fail clearly when the calamine engine is not installed."""
+
+    monkeypatch.setattr(btax, "CalamineWorkbook", None)
+
+    with pytest.raises(ImportError, match="requires python-calamine"):
+        transform_gemini_data(gemini_input, "calamine")
 
 
 def test_transform_swan_data(swan_input, swan_input_df):
@@ -148,10 +206,13 @@ def test_transform_swan_data(swan_input, swan_input_df):
     dataframe = transform_swan_data(swan_input)
     expected = swan_input_df
 
-    assert dataframe["timestamp"].tolist() == expected["timestamp"].tolist()
-    assert dataframe["type"].tolist() == expected["type"].tolist()
-    assert dataframe["usd"].tolist() == expected["usd"].tolist()
-    assert dataframe["btc"].tolist() == expected["btc"].tolist()
+    assert_frame_equal(
+        dataframe.reset_index(drop=True),
+        expected,
+        check_dtype=False,
+        check_categorical=False,
+        check_like=True,
+    )
 
 
 def test_transform_cashapp_data(cashapp_input, cashapp_input_df):
@@ -160,10 +221,50 @@ def test_transform_cashapp_data(cashapp_input, cashapp_input_df):
     dataframe = transform_cashapp_data(cashapp_input)
     expected = cashapp_input_df
 
-    assert dataframe["timestamp"].tolist() == expected["timestamp"].tolist()
-    assert dataframe["type"].tolist() == expected["type"].tolist()
-    assert dataframe["usd"].tolist() == expected["usd"].tolist()
-    assert dataframe["btc"].tolist() == expected["btc"].tolist()
+    assert_frame_equal(
+        dataframe.reset_index(drop=True),
+        expected,
+        check_dtype=False,
+        check_categorical=False,
+        check_like=True,
+    )
+
+
+def test_transform_cashapp_data_daylight_saving(tmp_path):
+    """Should convert EDT and EST dates to UTC with their own offsets."""
+
+    path = tmp_path / "cashapp.csv"
+    path.write_text(
+        CASHAPP_HEADER
+        + "a,2023-11-05 01:30:00 EST,Bitcoin Buy,USD,-$20,$0,-$20,BTC,"
+        + '"$35,000",0.0002,COMPLETED,,,Your Cash\n'
+        + "b,2023-11-05 01:30:00 EDT,Bitcoin Buy,USD,-$10,$0,-$10,BTC,"
+        + '"$35,000",0.0001,COMPLETED,,,Your Cash\n',
+        encoding="utf-8",
+    )
+
+    dataframe = transform_cashapp_data(path)
+
+    assert dataframe["timestamp"].tolist() == [
+        datetime(2023, 11, 5, 5, 30, tzinfo=timezone.utc),
+        datetime(2023, 11, 5, 6, 30, tzinfo=timezone.utc),
+    ]
+    assert dataframe["usd"].tolist() == [-10, -20]
+
+
+def test_transform_cashapp_data_unknown_timezone(tmp_path):
+    """Should reject dates in a timezone without a known offset."""
+
+    path = tmp_path / "cashapp.csv"
+    path.write_text(
+        CASHAPP_HEADER
+        + "a,2023-11-05 01:30:00 HST,Bitcoin Buy,USD,-$20,$0,-$20,BTC,"
+        + '"$35,000",0.0002,COMPLETED,,,Your Cash\n',
+        encoding="utf-8",
+    )
+
+    with pytest.raises(ValueError, match="Unknown Cash App timezone"):
+        transform_cashapp_data(path)
 
 
 def test_get_transactions(gemini_input_df, gemini_transactions):
@@ -171,3 +272,32 @@ def test_get_transactions(gemini_input_df, gemini_transactions):
 
     transactions = get_transactions(gemini_input_df)
     assert transactions == gemini_transactions
+
+
+def test_get_transactions_fractional(swan_input_df):
+    """Should convert fractional float amounts to exact satoshis and cents."""
+
+    transactions = get_transactions(swan_input_df)
+
+    assert [t.btc_sats for t in transactions] == [3479690, 1362289]
+    assert [t.usd_cents for t in transactions] == [-90000, -50000]
+
+
+def test_get_transactions_invalid_sign(gemini_input_df):
+    """Should reject transaction amounts with the wrong sign."""
+
+    input_df = gemini_input_df.copy()
+    input_df.loc[1, "usd"] = -5
+
+    with pytest.raises(ValueError, match="USD value must be positive"):
+        get_transactions(input_df)
+
+
+def test_get_transactions_missing_amount(gemini_input_df):
+    """Should reject transactions with a missing amount."""
+
+    input_df = gemini_input_df.astype({"usd": float})
+    input_df.loc[2, "usd"] = float("nan")
+
+    with pytest.raises(ValueError, match="must be finite numbers"):
+        get_transactions(input_df)
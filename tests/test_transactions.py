@@ -5,7 +5,7 @@ from decimal import Decimal
 
 import pytest
 
-from btax import Buy, Sell, Transaction
+from btax import Buy, Sell, Transaction, round_divide, to_fixed
 
 
 def test_tx_decimal():
@@ -16,6 +16,52 @@ def test_tx_decimal():
     assert txn.usd == Decimal("2.34")
 
 
+def test_tx_fixed_point():
+    """A transaction should hold amounts as integer satoshis and cents."""
+
+    txn = Transaction(datetime.now(), 1.23456789, 2.34)
+    assert txn.btc_sats == 123456789
+    assert txn.usd_cents == 234
+
+
+def test_tx_slots():
+    """Transactions should not carry a per-instance attribute dict."""
+
+    assert not hasattr(Buy(datetime.now(), 1, -1), "__dict__")
+    assert not hasattr(Sell(datetime.now(), -1, 1), "__dict__")
+
+
+def test_split_tx_rounding():
+    """Splitting should pro-rate USD to the nearest cent and keep the total."""
+
+    timestamp = datetime.now()
+    root = Buy(timestamp, 1, -1)
+    split, remainder = root.split_sats(33333333)
+
+    assert split == Buy(timestamp, 0.33333333, -0.33)
+    assert remainder == Buy(timestamp, 0.66666667, -0.67)
+
+
+def test_to_fixed():
+    """Should convert ints, Decimals, floats and strings to fixed point."""
+
+    assert to_fixed(2, 100) == 200
+    assert to_fixed(Decimal("1.005"), 100) == 100
+    assert to_fixed(1.23, 100) == 123
+    assert to_fixed("0.00000001", 10**8) == 1
+
+
+def test_round_divide():
+    """Should round integer division half to even."""
+
+    assert round_divide(5, 2) == 2
+    assert round_divide(7, 2) == 4
+    assert round_divide(-5, 2) == -2
+    assert round_divide(5, -2) == -2
+    assert round_divide(10, 3) == 3
+    assert round_divide(-20, 3) == -7
+
+
 def test_split_sell_tx():
     """Should be able to split a sell transaction at a btc amount."""
 
@@ -1,8 +1,15 @@
 """Output write tests."""
 
 import csv
+from datetime import datetime
 
-from btax import write_capital_gains
+from btax import (
+    Buy,
+    CapitalGain,
+    Sell,
+    write_capital_gains,
+    write_gains_streaming,
+)
 
 
 def test_write_capital_gains(tmp_path):
@@ -85,3 +92,62 @@ def test_write_capital_gains(tmp_path):
         reader = csv.reader(file)
         assert "Proceeds (Sales Price)" in next(reader)
         assert "1.12345678 BTC" in next(reader)
+
+
+def test_write_gains_streaming(tmp_path):
+    """Should write capital gains to csv files as they are produced."""
+
+    cap_gains = (
+        CapitalGain(
+            Buy(datetime(2020, 1, 1), 1, -1),
+            Sell(datetime(2020, 6, 1), -1, 10),
+        ),
+        CapitalGain(
+            Buy(datetime(2020, 1, 2), 10, -10),
+            Sell(datetime(2021, 6, 1), -10, 200),
+        ),
+        CapitalGain(
+            Buy(datetime(2020, 3, 1), 0.5, -5),
+            Sell(datetime(2020, 7, 1), -0.5, 20),
+        ),
+    )
+
+    write_gains_streaming(tmp_path, iter(cap_gains))
+
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        "2020_short_gains.csv",
+        "2021_long_gains.csv",
+    ]
+
+    with open(tmp_path / "2020_short_gains.csv", "r", encoding="utf-8") as file:
+        assert list(csv.reader(file)) == [
+            [
+                "Description of Property",
+                "Date Acquired",
+                "Date Sold or Disposed Of",
+                "Proceeds (Sales Price)",
+                "Cost or Other Basis",
+                "Gain or (loss)",
+            ],
+            [
+                "1.00000000 BTC",
+                "01/01/2020",
+                "06/01/2020",
+                "10.00",
+                "1.00",
+                "9.00",
+            ],
+            [
+                "0.50000000 BTC",
+                "03/01/2020",
+                "07/01/2020",
+                "20.00",
+                "5.00",
+                "15.00",
+            ],
+        ]
+
+    with open(tmp_path / "2021_long_gains.csv", "r", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        assert "Proceeds (Sales Price)" in next(reader)
+        assert "10.00000000 BTC" in next(reader)